@@ -1,18 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import argparse
 import configparser
 import gzip
+import heapq
+import io
+import json
 import logging
+import mmap
 import os
 import re
-import string
+import subprocess
 import sys
+from array import array
 from collections import namedtuple, defaultdict, OrderedDict
-from datetime import datetime
-from statistics import mean, median
-from string import Template
-from typing import Union, Generator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+from functools import lru_cache
+from itertools import repeat
+from typing import Union, Generator, Iterator, Iterable, Sequence
 
 config: dict = {
     "REPORT_SIZE": 1000,
@@ -22,44 +28,94 @@ config: dict = {
     "ACCEPTABLE_PARSED_SHARE": 0.333,
 }
 
+# Patterns are compiled once at import. Note `date` named group in the log file name pattern,
+# and `url` and `time` named groups in the log record pattern, they should persist.
+# Records in default format are parsed by `scan_record` without regex, other lines it passes to _URL_RE
+_LOG_NAME_PREFIX: str = 'nginx-access-ui.log-'
+_LOG_NAME_EXTENSIONS: tuple = ('', '.gz')  # plain text log, then gzipped
+_LOG_NAME_RE: re.Pattern = re.compile(
+    rf"^{re.escape(_LOG_NAME_PREFIX)}(?P<date>\d{{8}})({'|'.join(map(re.escape, _LOG_NAME_EXTENSIONS))})$",
+    re.IGNORECASE)
+# No lookarounds, backreferences or lazy quantifiers, so the pattern is also valid for linear-time engines like RE2,
+# and backtracking in sre is bounded: url runs to the closing quote of the request and steps back to ` http/1.1`,
+# time is found back from the line end. Applied to raw bytes of a block of log lines, it never matches across
+# line breaks, so `find_records` doesn't have to search its lines again
+_URL_RE: re.Pattern = re.compile(rb'"GET (?P<url>[^"\n]+) http/1\.1"[^\n]*[ \t](?P<time>\d+\.\d{3})$',
+                                 re.IGNORECASE | re.MULTILINE)
+# Pattern log records are parsed with, in both serial and parallel parsing. None for `scan_record`, set to _URL_RE
+# (or its altered copy) if log format changes
+_RECORD_PATTERN: Union[re.Pattern, None] = None
+
+
+@lru_cache(maxsize=8)
+def read_config_file(path: str, mtime_ns: int) -> Union[tuple, None]:
+    """
+    Parses config file once per its path and modification time, so repeated reads of unchanged file are free.
+    :param path: path to a config file
+    :param mtime_ns: modification time of the file, part of the cache key only. Changed file is parsed again
+    :return: (key, value) str pairs from `config` section, None if the file is missing or has no sections
+    """
+    config_from_file = configparser.ConfigParser()
+    config_from_file.optionxform = str  # keep keys uppercase
+    config_from_file.read(path)
+    return tuple(config_from_file.items('config')) if config_from_file.sections() else None
+
+
+def get_config_arg(argv: list) -> str:
+    """
+    Gets config file path from CLI args without building an argparse parser. argparse is imported only for
+    the args other than `[--config [path]]`, e.g. --help or unknown ones, to print help or errors.
+    :param argv: CLI args, without the script name
+    :return: '' if --config is not provided, './config.ini' if provided without a value
+    """
+    if not argv:
+        return ''
+    if argv[0] == '--config' and (len(argv) == 1 or len(argv) == 2 and not argv[1].startswith('-')):
+        return argv[1] if len(argv) == 2 else './config.ini'
+    if len(argv) == 1 and argv[0].startswith('--config='):
+        return argv[0][len('--config='):]
+    import argparse
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument('--config', default='', const='./config.ini', nargs='?', help='Path to a config file')
+    return parser.parse_args(argv).config
+
 
 def get_config(current_config: dict) -> dict:
     """
-    Defines parser for CLI args. If --config option provided there, tries to read config file, parse parameters from it,
+    Gets --config option from CLI args. If provided there, tries to read config file, parse parameters from it,
     and alters the default `current_config` dict. Raises exceptions if file contains unreadable parameters or not
     exists.
     :param current_config: current config dict
     :return: updated config dict
     """
     # Check if --config provided, updating config
-    parser: argparse.ArgumentParser = argparse.ArgumentParser()
-    parser.add_argument('--config', default='', const='./config.ini', nargs='?', help='Path to a config file')
-    args: argparse.Namespace = parser.parse_args()
+    config_path: str = get_config_arg(sys.argv[1:])
 
     current_config: dict = current_config.copy()  # avoiding updating global config
     current_config['SCRIPT_LOG'] = current_config.get('SCRIPT_LOG', None)
     current_config['SCRIPT_LOG_LEVEL'] = current_config.get('SCRIPT_LOG_LEVEL', 'INFO')
-    if args.config:  # -- config argument is provided in CLI
+    if config_path:  # -- config argument is provided in CLI
         try:
-            print(f'Reading config from {args.config}')
-            config_from_file = configparser.ConfigParser()
-            config_from_file.optionxform = str  # keep keys uppercase
-            config_from_file.read(args.config)
-            if config_from_file.sections():
-                config_from_file = dict(config_from_file.items('config'))
+            print(f'Reading config from {config_path}')
+            try:
+                mtime_ns: int = os.stat(config_path).st_mtime_ns
+            except OSError:  # reported below, as the file without sections
+                mtime_ns: int = 0
+            config_from_file: Union[tuple, None] = read_config_file(config_path, mtime_ns)
+            if config_from_file is not None:
                 current_config.update(config_from_file)
             else:
-                print(f'Unable to read from {args.config}. Exiting...')
+                print(f'Unable to read from {config_path}. Exiting...')
                 raise Exception
             # convert from str if provided in config file
             current_config['REPORT_SIZE'] = int(current_config['REPORT_SIZE'])
             current_config['ACCEPTABLE_PARSED_SHARE'] = float(current_config['ACCEPTABLE_PARSED_SHARE'])
         except configparser.MissingSectionHeaderError:
-            print(f'Config file {args.config} seems to be incorrectly formatted.')
+            print(f'Config file {config_path} seems to be incorrectly formatted.')
             raise
         except ValueError:  # possibly problem with type conversion from str
             print(
-                f'Unable to parse parameters from config {args.config}. Check file against default config.ini.')
+                f'Unable to parse parameters from config {config_path}. Check file against default config.ini.')
             raise
     return current_config
 
@@ -81,56 +137,304 @@ def set_logging(working_config: dict) -> None:
     sys.excepthook = handle_exception
 
 
-def get_latest_log(path: str, pattern: str) -> Union[namedtuple, None]:
+LogFile = namedtuple('LogFile', ['file_path', 'date'])
+
+
+@lru_cache(maxsize=4096)
+def _parse_yyyymmdd(date_str: str) -> date:
+    """
+    Same as datetime.strptime(date_str, '%Y%m%d').date() for the fixed yyyymmdd shape, without parsing the format.
+    Raises ValueError if the date is invalid
+    :param date_str: date as yyyymmdd
+    :return: date
+    """
+    return date(int(date_str[:4]), int(date_str[4:6]), int(date_str[6:8]))
+
+
+def get_latest_log(path: str, pattern: Union[str, re.Pattern] = _LOG_NAME_RE) -> Union[namedtuple, None]:
     """
     Get plain text or .gz log file with the latest date in it's name,
     in the `path` dir. If nothing found returns None
     :param path: relative path to the target dir
-    :param pattern: target regexp pattern. Must include `date` named group to discover yyyymmdd date format
+    :param pattern: target regexp pattern, str or precompiled. Must include `date` named group to discover
+    yyyymmdd date format
     :return: named tuple with str `file_path` (name of the file found) and extracted `date` as datetime.date.
     """
-    file_name_pattern: re.Pattern = re.compile(pattern, re.IGNORECASE)
-    files: list = os.listdir(path)
+    file_name_pattern: re.Pattern = re.compile(pattern, re.IGNORECASE) if isinstance(pattern, str) else pattern
     latest_file: str = ''
-    latest_date: datetime.date = datetime(1970, 1, 1).date()
-    for file in files:
-        match: Union[re.Match, None] = file_name_pattern.search(file)
+    latest_date: str = ''  # yyyymmdd strings compare in the same order as dates
+    with os.scandir(path) as entries:  # single pass over the directory, entries are never stat'ed
+        for entry in entries:
+            match: Union[re.Match, None] = file_name_pattern.search(entry.name)
+            if match and match.group('date') > latest_date:
+                latest_file = entry.name
+                latest_date = match.group('date')
+    if not latest_file:
+        return None
+    return LogFile(file_path=os.path.join(path, latest_file), date=_parse_yyyymmdd(latest_date))
+
+
+def get_latest_log_probe(path: str, today: date, lookback_days: int = 30) -> Union[namedtuple, None]:
+    """
+    Get plain text or .gz log file with the latest date in it's name, in the `path` dir, probing expected file names
+    for the last `lookback_days` days, starting with `today`, instead of listing the whole directory. One stat per
+    candidate, so it doesn't depend on the number of files in the dir. If nothing found returns None.
+    Unlike `get_latest_log`, names are probed exactly as `_LOG_NAME_PREFIX` + yyyymmdd + extension, so on case-sensitive
+    file systems names in other case are not found. If both plain text and .gz logs exist for the date, plain text
+    one is returned, in order of `_LOG_NAME_EXTENSIONS`
+    :param path: relative path to the target dir
+    :param today: the latest date to probe
+    :param lookback_days: number of days to probe
+    :return: named tuple with str `file_path` (name of the file found) and `date` as datetime.date.
+    """
+    for days in range(lookback_days):
+        log_date: date = today - timedelta(days=days)
+        for extension in _LOG_NAME_EXTENSIONS:
+            file_path: str = os.path.join(path, f"{_LOG_NAME_PREFIX}{log_date.strftime('%Y%m%d')}{extension}")
+            try:
+                os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            return LogFile(file_path=file_path, date=log_date)
+    return None
+
+
+# Size of read buffer for log files
+_READ_BUFFER_SIZE: int = 128 * 1024
+# Plain text logs of this size and larger are parsed in parallel, by slices, if more than one CPU is available
+_PARALLEL_MIN_SIZE: int = 64 * 1024 * 1024
+# External decompressors, tried in order for .gz logs. Decompression runs in a separate process, parallel to parsing.
+# igzip (ISA-L) inflates several times faster than zlib-based tools, using SIMD and carry-less multiply for CRC
+_GZIP_DECOMPRESSORS: tuple = (('igzip', '-d', '-c'), ('pigz', '-dc'), ('gzip', '-dc'))
+
+
+@contextmanager
+def open_log(file_name: str) -> Iterator[Union[io.BufferedIOBase, mmap.mmap]]:
+    """
+    Opens log file for reading in binary mode. Plain text files are memory-mapped, so the pages are read by the kernel
+    on demand, without copying to an intermediate buffer. Files ending with .gz are decompressed by the first external
+    decompressor from `_GZIP_DECOMPRESSORS` found on PATH, falling back to gzip module if none is available.
+    Raises subprocess.CalledProcessError if the decompressor fails.
+    :param file_name: Full path to a file
+    :return: binary stream (or memory map, having the same `read` method) with log lines
+    """
+    if not file_name.endswith('.gz'):
+        with open(file_name, 'rb', buffering=_READ_BUFFER_SIZE) as f:
+            if not os.fstat(f.fileno()).st_size:  # empty file can't be mapped
+                yield f
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, 'madvise'):  # not available on Windows
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                yield mm
+        return
+    for decompressor in _GZIP_DECOMPRESSORS:
+        cmd: list = [*decompressor, file_name]
+        try:
+            proc: subprocess.Popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=1 << 20)
+        except FileNotFoundError:  # decompressor is not installed, trying the next one
+            continue
+        logging.debug(f'Decompressing {file_name} with {decompressor[0]}')
+        with proc:
+            yield proc.stdout
+        if proc.returncode > 0:  # negative is a signal, e.g. SIGPIPE if the stream was closed before the end
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+        return
+    logging.debug(f'No external decompressor found, decompressing {file_name} with gzip module')
+    with io.BufferedReader(gzip.open(file_name, 'rb'), buffer_size=_READ_BUFFER_SIZE) as f:
+        yield f
+
+
+def read_chunks(f: Union[io.BufferedIOBase, mmap.mmap], size: int = _READ_BUFFER_SIZE,
+                length: int = -1) -> Generator[bytes, None, None]:
+    """
+    Reads binary stream by blocks of about `size` bytes. Each block ends with a line break (except, possibly,
+    the last one), so no line is split between blocks.
+    :param f: binary stream
+    :param size: number of bytes to read at once
+    :param length: number of bytes to read from the current position, -1 to read till the end
+    :return: block of whole lines
+    """
+    tail: bytes = b''
+    while chunk := f.read(size if length < 0 else min(size, length)):
+        length -= len(chunk)
+        end: int = chunk.rfind(b'\n') + 1
+        if not end:  # line is longer than a block
+            tail += chunk
+            continue
+        yield tail + chunk[:end]
+        tail = chunk[end:]
+    if tail:
+        yield tail
+
+
+def get_line_start(mm: mmap.mmap, offset: int) -> int:
+    """
+    Finds the first line starting at or after `offset` in memory-mapped file
+    :param mm: memory-mapped file
+    :param offset: byte offset
+    :return: byte offset of the line start, or file size if there are no more lines
+    """
+    if offset <= 0:
+        return 0
+    line_break: int = mm.find(b'\n', offset - 1)
+    return len(mm) if line_break < 0 else line_break + 1
+
+
+def scan_record(line: bytes) -> Union[tuple, None]:
+    """
+    Extracts requested url and request processing time from a log record. Records in the default format are parsed
+    with substring search from both ends of the line, so no regex backtracking is involved. Other lines (e.g. `get`
+    or `http/1.1` in lower case, tab before the time) are left to `_URL_RE`, so the results are the same as with it:
+    time is accepted in `123.456` shape only, not `nan`, `1e3` and such, which float() would take.
+    :param line: raw log line
+    :return: url:str, time:float or None if the record doesn't match `_URL_RE`
+    """
+    url_start: int = line.find(b'"GET ') + 5
+    url_end: int = line.find(b' HTTP/1.1" ', url_start + 1) if url_start != 4 else -1
+    time_start: int = line.rfind(b' ') + 1
+    time: bytes = line[time_start:]
+    if (url_end >= 0 and time_start > url_end + 11  # time is the last field, after the request
+            and line.find(b'"', url_start, url_end) < 0  # request quotes can't be inside url, as for _URL_RE
+            and len(time) > 4 and time[-4] == 46 and time.replace(b'.', b'0', 1).isdigit()):  # 123.456, 46 is `.`
+        return line[url_start:url_end].decode('utf-8', 'backslashreplace'), float(time)
+    match: Union[re.Match, None] = _URL_RE.search(line)
+    if not match:
+        return None
+    url, time = match.group('url', 'time')
+    return url.decode('utf-8', 'backslashreplace'), float(time)
+
+
+def find_records(chunk: bytes, pattern: re.Pattern, groups: tuple) -> Generator[tuple, None, None]:
+    """
+    Finds records in a block of log lines with `pattern` search over the whole block, instead of searching line by
+    line. Generates records of the matched lines only, in order. Only the first match in a line counts. A match
+    running over a line break (e.g. with `\s` in the pattern) is searched for again within its line only, as if
+    the lines were searched one by one, and the search goes on from the next line.
+    :param chunk: block of whole lines
+    :param pattern: compiled bytes pattern with re.MULTILINE flag
+    :param groups: numbers of `url` and `time` groups in the pattern
+    :return: url:str, time:float
+    """
+    search = pattern.search  # local name, avoiding attribute lookup per match
+    pos: int = 0
+    while match := search(chunk, pos):
+        match_start, match_end = match.span()
+        line_end: int = chunk.find(b'\n', match_start)  # end of the line the match starts in
+        if line_end < 0:
+            line_end = len(chunk)
+        if match_end > line_end:  # ran over a line break, the line alone is searched from the match start
+            match = search(chunk, match_start, line_end)
         if match:
-            date: Union[str, datetime.date] = match.group('date')
-            date = datetime.strptime(date, '%Y%m%d').date()
-            if date > latest_date:
-                latest_file = file
-                latest_date = date
-    LogFile = namedtuple('LogFile', ['file_path', 'date'])
-    return LogFile(file_path=os.path.join(path, latest_file), date=latest_date) if latest_file else None
+            url, time = match.group(*groups)
+            yield url.decode('utf-8', 'backslashreplace'), float(time)
+        pos = line_end + 1
 
 
-def get_url_time_from_record(file_name: str, pattern: str) -> Generator[tuple, None, None]:
+def get_url_time_from_record(file_name: str, pattern: Union[str, bytes, re.Pattern, None] = None,
+                             start: int = 0, end: Union[int, None] = None,
+                             counter: Union[list, None] = None) -> Generator[tuple, None, None]:
     """
     Generates next parsed line from `file_name` (log file), yielding requested url and request processing time.
-    If pattern didn't match, url = '-', time = 0.0.
+    Lines the pattern didn't match are skipped, only counted.
     :param file_name: Full path to a file
-    :param pattern: Regexp patter, required to include `url` and `time` named groups
+    :param pattern: Regexp patter, str, bytes or precompiled bytes pattern, required to include `url` and `time`
+    named groups. If None, records are parsed by `scan_record`
+    :param start: byte offset, only lines starting at or after it are parsed. Non-empty plain text logs only
+    :param end: byte offset, only lines starting before it are parsed. Non-empty plain text logs only
+    :param counter: one item list, receives the number of lines processed, parsed or not
     :return: url:str, time:float
     """
-    file_opener = gzip.open if file_name.endswith('.gz') else open
-    url_pattern: re.Pattern = re.compile(pattern, re.IGNORECASE)
-    with file_opener(file_name, 'rt') as f:
-        record_count: int = sum(1 for _ in f)
-        f.seek(0)
-        record_processed: int = 0
-        for i, line in enumerate(f):
-            url: str = '-'
-            time: float = 0.0
-            match = url_pattern.search(line)
-            if match:
-                url: str = match.group('url')
-                time: float = float(match.group('time'))
-                record_processed += 1
-            if i % 100000 == 0:
-                progress: float = (i + 1) / record_count * 100
-                print(f'Progress: {progress:.0f}%', end='\r')
-            yield url, time
+    if isinstance(pattern, str):
+        pattern = pattern.encode()
+    if isinstance(pattern, bytes):
+        pattern = re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+    elif pattern is not None and not pattern.flags & re.MULTILINE:  # `$` should match at every line end
+        pattern = re.compile(pattern.pattern, pattern.flags | re.MULTILINE)
+    groups: tuple = (pattern.groupindex['url'], pattern.groupindex['time']) if pattern else ()  # named groups numbers
+
+    with open_log(file_name) as f:  # single pass: the total number of records is unknown until the end
+        length: int = -1
+        if start or end is not None:  # slice of memory-mapped file, aligned to line starts
+            start = get_line_start(f, start)
+            length = (len(f) if end is None else get_line_start(f, end)) - start
+            f.seek(start)
+        records_processed: int = 0
+        progress_step: int = 100000
+        for chunk in read_chunks(f, length=length):
+            if pattern is None:
+                lines: list = chunk.splitlines()
+                records_processed += len(lines)  # progress is tracked per block, not per line
+                records: Iterator = map(scan_record, lines)  # map drives the per-line calls from C
+            else:
+                if b'\r' in chunk:  # `$` doesn't match before \r\n
+                    chunk = chunk.replace(b'\r\n', b'\n')
+                records_processed += chunk.count(b'\n') + (chunk[-1:] != b'\n')
+                records: Iterator = find_records(chunk, pattern, groups)
+            if counter is not None:
+                counter[0] = records_processed
+            if records_processed >= progress_step:
+                print(f'Records processed: {records_processed}', end='\r')
+                progress_step = records_processed + 100000
+            yield from filter(None, records)
+
+
+def aggregate_url_times(records: Iterable[tuple]) -> dict:
+    """
+    Aggregates url and request processing time records into per url [time sum, time max, times]. Times are kept
+    in a compact array of doubles, as they are still needed for the median. The loop over records only appends
+    times, sums and maximums are computed by C builtins over each url's array afterwards.
+    :param records: url:str, time:float pairs
+    :return: dict with urls in order of the first appearance
+    """
+    url_times: defaultdict = defaultdict(lambda: array('d'))
+    for url, time in records:
+        url_times[url].append(time)
+    return {url: [sum(times), max(times), times] for url, times in url_times.items()}
+
+
+def merge_url_stats(url_stats: dict, other: dict) -> None:
+    """
+    Merges `other` per url statistics, aggregated from a subsequent part of the log, into `url_stats`
+    :param url_stats: dict from `aggregate_url_times`, updated in place
+    :param other: dict from `aggregate_url_times`
+    """
+    for url, (time_sum, time_max, times) in other.items():
+        stats: Union[list, None] = url_stats.get(url)
+        if stats is None:
+            url_stats[url] = [time_sum, time_max, times]
+            continue
+        stats[0] += time_sum
+        stats[1] = max(stats[1], time_max)
+        stats[2].extend(times)
+
+
+def aggregate_log_slice(file_name: str, start: int, end: int, pattern: Union[re.Pattern, None] = None) -> tuple:
+    """
+    Parses and aggregates lines of plain text log, starting within [`start`, `end`) byte range. Runs in a worker
+    process.
+    :param file_name: Full path to a file
+    :param start: byte offset
+    :param end: byte offset
+    :param pattern: as for `get_url_time_from_record`
+    :return: dict from `aggregate_url_times`, number of lines processed
+    """
+    counter: list = [0]
+    records: Iterator = get_url_time_from_record(file_name, pattern, start=start, end=end, counter=counter)
+    return aggregate_url_times(records), counter[0]
+
+
+def get_median(values: Sequence[float]) -> float:
+    """
+    Median of not empty `values`. Same as statistics.median, without its input checks and conversion to list
+    :param values: numbers, not necessarily sorted
+    :return: median
+    """
+    values_sorted: list = sorted(values)
+    middle: int = len(values_sorted) // 2
+    if len(values_sorted) % 2:
+        return values_sorted[middle]
+    return (values_sorted[middle - 1] + values_sorted[middle]) / 2
 
 
 def get_validated_path(path_chunks: list, path_descr: str = None) -> str:
@@ -143,9 +447,11 @@ def get_validated_path(path_chunks: list, path_descr: str = None) -> str:
     """
     path: str = os.path.join(*path_chunks)
     path = os.path.normpath(path)  # avoiding mix slashes
-    if not os.path.exists(path):
+    try:
+        os.stat(path)  # single syscall, as os.path.exists, but the cause is kept in the IOError raised
+    except (OSError, ValueError) as e:
         logging.error(f'The path {path} is not found ({path_descr}). Exiting...')
-        raise IOError
+        raise IOError(f'{path_descr}: {path}') from e
     return path
 
 
@@ -163,8 +469,7 @@ def main():
     report_dir: str = get_validated_path([working_config['REPORT_DIR'], ], 'Report directory')
 
     logging.debug('Finding the latest log to parse')
-    log_file_pattern: str = r"^nginx-access-ui\.log-(?P<date>\d{8})($|\.gz$)"
-    log_file: namedtuple = get_latest_log(log_dir, log_file_pattern)
+    log_file: namedtuple = get_latest_log(log_dir)
     if not log_file:
         logging.info('Log file is not found! Nothing to do. Exiting...')
         sys.exit(0)
@@ -176,21 +481,32 @@ def main():
         logging.info(f'The report for the latest date already exists: {report_file}. Exiting...')
         sys.exit(0)
 
-    logging.debug('Set up pattern to parse log records')
-    # Note `url` and `time` named groups
-    url_pattern: str = r'"GET (?P<url>.+?(?=\ http\/1.1")) http\/1.1"\s+.*?(?P<time>\d+\.\d{3})$'
-    url_times: defaultdict = defaultdict(list)
-
     logging.debug('Go parsing')
-    for url, time in get_url_time_from_record(log_file.file_path, url_pattern):
-        url_times[url].append(time)
+    workers: int = os.cpu_count() or 1
+    log_size: int = os.path.getsize(log_file.file_path)
+    if workers > 1 and not log_file.file_path.endswith('.gz') and log_size >= _PARALLEL_MIN_SIZE:
+        logging.debug(f'Parsing in {workers} processes')
+        slice_size: int = log_size // workers + 1
+        slice_starts: range = range(0, workers * slice_size, slice_size)
+        slice_ends: range = range(slice_size, (workers + 1) * slice_size, slice_size)
+        url_stats: dict = {}
+        records_processed: int = 0
+        with ProcessPoolExecutor(workers) as executor:
+            # results come in order of slices, as in the log, each merged as soon as it's ready,
+            # while the later slices are still parsed
+            for slice_stats, slice_processed in executor.map(aggregate_log_slice, repeat(log_file.file_path),
+                                                             slice_starts, slice_ends, repeat(_RECORD_PATTERN)):
+                merge_url_stats(url_stats, slice_stats)
+                records_processed += slice_processed
+    else:
+        counter: list = [0]
+        url_stats: dict = aggregate_url_times(get_url_time_from_record(log_file.file_path, _RECORD_PATTERN,
+                                                                            counter=counter))
+        records_processed: int = counter[0]
     logging.debug('Finished parsing')
 
     logging.debug('Finding the proportion of the successfully parsed records. Exit if proportion is too small')
-    records_processed: int = sum(map(len, url_times.values()))
-    if '-' in url_times:
-        del url_times['-']
-    records_parsed: int = sum(map(len, url_times.values()))
+    records_parsed: int = sum(len(stats[2]) for stats in url_stats.values())
     records_parsed_share: float = round(records_parsed / records_processed, 3)
     logging.debug(f"The share of records parsed: {records_parsed_share}, "
                   f"threshold: {working_config['ACCEPTABLE_PARSED_SHARE']}")
@@ -201,25 +517,26 @@ def main():
         sys.exit(0)
 
     logging.debug(f"Crop top {working_config['REPORT_SIZE']} of urls with slowest total time")
-    # Use OrderedDict, so to preserve initial records' sort order in the report
-    top_url_times: OrderedDict = OrderedDict(sorted(url_times.items(),
-                                                    key=lambda x: -sum(x[1]))[:working_config['REPORT_SIZE']])
+    # Use OrderedDict, so to preserve initial records' sort order in the report. Partial heap selection instead of
+    # sorting all urls, ties keep the order of appearance in the log
+    top_url_stats: OrderedDict = OrderedDict(heapq.nlargest(working_config['REPORT_SIZE'], url_stats.items(),
+                                                            key=lambda x: x[1][0]))
 
-    times_sum: float = sum(map(sum, top_url_times.values()))
+    times_sum: float = sum(stats[0] for stats in top_url_stats.values())
     logging.debug(f"Total processing time of `slowest` {working_config['REPORT_SIZE']} urls: {times_sum}")
-    times_count: int = sum(map(len, top_url_times.values()))
+    times_count: int = sum(len(stats[2]) for stats in top_url_stats.values())
     logging.debug(f"Total N of requests for `slowest` {working_config['REPORT_SIZE']} urls: {times_count}")
 
     logging.debug(f'Populating the resulting JSON with url statistics')
     table: list = []
-    for k, v in top_url_times.items():
+    for k, (v_sum, v_max, v) in top_url_stats.items():  # only median needs to traverse the times
         table.append({'url': k,
                       'count': len(v),
-                      'time_avg': round(mean(v), 3),
-                      'time_max': max(v),
-                      'time_sum': round(sum(v), 3),
-                      'time_med': round(median(v), 3),
-                      'time_perc': round(sum(v) / times_sum, 3),
+                      'time_avg': round(v_sum / len(v), 3),
+                      'time_max': v_max,
+                      'time_sum': round(v_sum, 3),
+                      'time_med': round(get_median(v), 3),
+                      'time_perc': round(v_sum / times_sum, 3),
                       'count_perc': round(len(v) / times_count, 3),
                       })
 
@@ -230,11 +547,16 @@ def main():
         f", time_avg {first_row['time_avg']}, time_max {first_row['time_max']}, time_med {first_row['time_med']}"
         f", time_perc {first_row['time_perc']}, time_sum {first_row['time_sum']}")
     logging.debug('Rendering report template')
-    with open(report_template_file, 'rt') as f:
-        template: string.Template = Template(f.read())
+    with open(report_template_file, 'rt', encoding='utf-8') as f:
+        template_head, _, template_tail = f.read().partition('$table_json')
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
     logging.debug('Writing the report')
-    with open(report_file, 'w') as f:
-        f.write(template.safe_substitute({'table_json': table}))
+    with open(report_file, 'w', encoding='utf-8') as f:  # rows are written one by one, no copy of the whole report
+        f.write(template_head + '[')
+        for i, row in enumerate(table):
+            # `</` is escaped, so that no url can close the <script> element the table is embedded into
+            f.write((',' if i else '') + encode(row).replace('</', '<\\/'))
+        f.write(']' + template_tail)
 
     logging.info("Log analyzer finished")
     logging.shutdown()
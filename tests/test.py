@@ -1,32 +1,59 @@
 import configparser
+import io
+import logging
 import os
+import re
 import unittest
-from datetime import datetime
+from contextlib import suppress
+from datetime import date, datetime
 from unittest.mock import patch
 
 import log_analyzer
 from log_analyzer import get_latest_log, get_validated_path, get_config
 
 TESTS_DIR = os.path.join('tests')
+GZ_LOG_DIR = os.path.join(TESTS_DIR, 'get_latest_gz_log_20170630')
+PLAIN_LOG_DIR = os.path.join(TESTS_DIR, 'get_latest_plain_log_20170630')
 
 
 class GetLatestLogTest(unittest.TestCase):
-    log_file_pattern = r"^nginx-access-ui\.log-(?P<date>\d{8})($|\.gz$)"
+    log_file_pattern = re.compile(r"^nginx-access-ui\.log-(?P<date>\d{8})($|\.gz$)")  # compiled once for all tests
 
     def test_get_latest_gz_w_date(self):
-        log_dir_mock = os.path.join(TESTS_DIR, 'get_latest_gz_log_20170630')
-        log_file_latest = os.path.join(log_dir_mock, 'nginx-access-ui.log-20170630.gz')
-        log_file = get_latest_log(log_dir_mock, self.log_file_pattern)
+        log_file_latest = os.path.join(GZ_LOG_DIR, 'nginx-access-ui.log-20170630.gz')
+        log_file = get_latest_log(GZ_LOG_DIR, self.log_file_pattern)
         self.assertEqual(log_file_latest, log_file.file_path)
         self.assertEqual(datetime(2017, 6, 30).date(), log_file.date)
 
     def test_get_latest_plain_w_date(self):
-        log_dir_mock = os.path.join(TESTS_DIR, 'get_latest_plain_log_20170630')
-        log_file_latest = os.path.join(log_dir_mock, 'nginx-access-ui.log-20170630')
-        log_file = get_latest_log(log_dir_mock, self.log_file_pattern)
+        log_file_latest = os.path.join(PLAIN_LOG_DIR, 'nginx-access-ui.log-20170630')
+        log_file = get_latest_log(PLAIN_LOG_DIR, self.log_file_pattern)
         self.assertEqual(log_file_latest, log_file.file_path)
         self.assertEqual(datetime(2017, 6, 30).date(), log_file.date)
 
+    def test_get_latest_str_pattern(self):
+        # pattern as str gives the same result as precompiled
+        self.assertEqual(get_latest_log(PLAIN_LOG_DIR, self.log_file_pattern),
+                         get_latest_log(PLAIN_LOG_DIR, self.log_file_pattern.pattern))
+
+
+# the directory is never listed by the probe
+@patch('log_analyzer.os.scandir', side_effect=AssertionError('directory listed'))
+@patch('log_analyzer.os.listdir', side_effect=AssertionError('directory listed'))
+class GetLatestLogProbeTest(unittest.TestCase):
+    def test_get_latest_plain(self, *_):
+        log_file = log_analyzer.get_latest_log_probe(PLAIN_LOG_DIR, date(2017, 7, 2))
+        self.assertEqual(os.path.join(PLAIN_LOG_DIR, 'nginx-access-ui.log-20170630'), log_file.file_path)
+        self.assertEqual(date(2017, 6, 30), log_file.date)
+
+    def test_get_latest_gz(self, *_):
+        log_file = log_analyzer.get_latest_log_probe(GZ_LOG_DIR, date(2017, 6, 30))
+        self.assertEqual(os.path.join(GZ_LOG_DIR, 'nginx-access-ui.log-20170630.gz'), log_file.file_path)
+        self.assertEqual(date(2017, 6, 30), log_file.date)
+
+    def test_get_latest_out_of_lookback(self, *_):
+        self.assertIsNone(log_analyzer.get_latest_log_probe(PLAIN_LOG_DIR, date(2017, 7, 2), lookback_days=2))
+
 
 class GetValidatedPathTest(unittest.TestCase):
     invalid_path = ['abrakadabra', 'foo']
@@ -55,6 +82,15 @@ class GetConfigTest(unittest.TestCase):
         self.assertEqual('./test_log.txt', config['SCRIPT_LOG'])
         self.assertEqual(1000, config['REPORT_SIZE'])  # report size remained untouched
 
+    @patch('log_analyzer.sys.argv',
+           ['log_analyzer.py', '--config', os.path.join(TESTS_DIR, 'get_config', 'good_config.ini')])
+    def test_get_good_config_cached(self):
+        # unchanged file is parsed once
+        log_analyzer.read_config_file.cache_clear()
+        self.assertEqual(get_config(log_analyzer.config), get_config(log_analyzer.config))
+        self.assertEqual(1, log_analyzer.read_config_file.cache_info().misses)
+        self.assertEqual(1, log_analyzer.read_config_file.cache_info().hits)
+
     @patch('log_analyzer.sys.argv',
            ['log_analyzer.py', '--config', os.path.join(TESTS_DIR, 'get_config', 'nonexistent_config.ini')])
     def test_get_nonexistent_config(self):
@@ -73,9 +109,34 @@ class GetConfigTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             _ = get_config(log_analyzer.config)
 
+    def test_get_config_arg(self):
+        # same as argparse with --config option of default='', const='./config.ini', nargs='?'
+        for argv, expected in (([], ''), (['--config'], './config.ini'), (['--config', 'my.ini'], 'my.ini'),
+                               (['--config=my.ini'], 'my.ini'), (['--conf', 'my.ini'], 'my.ini')):
+            with self.subTest(argv=argv):
+                self.assertEqual(expected, log_analyzer.get_config_arg(argv))
+
+    @patch('sys.stderr', io.StringIO())
+    def test_get_config_arg_unknown(self):
+        # unknown args are reported by argparse
+        with self.assertRaises(SystemExit):
+            log_analyzer.get_config_arg(['--config', 'my.ini', '--foo'])
+
+
+class ReadChunksTest(unittest.TestCase):
+    data = b'first line\nsecond longer line\nthird line\nlast line without line break'
+
+    def test_read_chunks(self):
+        for size in (1, 5, 16, 1024):
+            chunks = list(log_analyzer.read_chunks(io.BytesIO(self.data), size))
+            self.assertEqual(self.data, b''.join(chunks))
+            for chunk in chunks[:-1]:  # lines are never split between chunks
+                self.assertTrue(chunk.endswith(b'\n'))
+
 
 class GetURLTimeFromRecordTest(unittest.TestCase):
     log_file = os.path.join(TESTS_DIR, 'get_url_time_from_record', 'nginx-access-ui.log-20240301')
+    crafted_log_file = os.path.join(TESTS_DIR, 'get_url_time_from_record', 'nginx-access-ui.log-20240302')
     url_pattern = r'"GET (?P<url>.+?(?=\ http\/1.1")) http\/1.1"\s+.*?(?P<time>\d+\.\d{3})$'
     iter_reader = log_analyzer.get_url_time_from_record(log_file, url_pattern)
 
@@ -84,16 +145,103 @@ class GetURLTimeFromRecordTest(unittest.TestCase):
         self.assertEqual('/api/v2/banner/16852664', url)
         self.assertEqual(0.199, time)
 
-        # on the second line log record is corrupted, pattern unreadable
-        url, time = next(self.iter_reader)
-        self.assertEqual('-', url)
-        self.assertEqual(0, time)
+        # on the next lines log records are corrupted, pattern unreadable, so they are skipped
+        self.assertEqual([], list(self.iter_reader))
+
+    def test_parse_counter(self):
+        # lines are counted, whether parsed or not
+        counter = [0]
+        records = list(log_analyzer.get_url_time_from_record(self.log_file, counter=counter))
+        with open(self.log_file, 'rb') as f:
+            self.assertEqual(len(f.read().splitlines()), counter[0])
+        self.assertEqual(1, len(records))
+
+    def test_parse_default_format(self):
+        # scan_record gives the same results as the regex pattern and _URL_RE
+        self.assertEqual(list(log_analyzer.get_url_time_from_record(self.log_file, self.url_pattern)),
+                         list(log_analyzer.get_url_time_from_record(self.log_file)))
+        for log_file in (self.log_file, self.crafted_log_file):
+            with self.subTest(log_file=log_file):
+                self.assertEqual(list(log_analyzer.get_url_time_from_record(log_file, log_analyzer._URL_RE)),
+                                 list(log_analyzer.get_url_time_from_record(log_file)))
+
+    def test_parse_crafted(self):
+        # markers in any case, time in 123.456 shape only, not nan, inf, 1e3, 1_000 or 0.39, spaces in url,
+        # no quotes in url
+        expected = [('/api/v2/banner/25019354', 0.39), ('/api/v2/lower-case-method', 0.2),
+                    ('/api/v2/lower-case-protocol', 0.3), ('/api/v2/time-after-tab', 0.4),
+                    ('/api/v2/url with space', 0.5), ('/api/v2/after-quote', 0.6)]
+        self.assertEqual(expected, list(log_analyzer.get_url_time_from_record(self.crafted_log_file)))
+        self.assertEqual(expected, list(log_analyzer.get_url_time_from_record(self.crafted_log_file,
+                                                                              log_analyzer._URL_RE)))
+
+    def test_parse_module_pattern(self):
+        # _URL_RE, written without lookahead, gives the same results
+        self.assertEqual(list(log_analyzer.get_url_time_from_record(self.log_file, self.url_pattern)),
+                         list(log_analyzer.get_url_time_from_record(self.log_file, log_analyzer._URL_RE)))
+
+    def test_find_records(self):
+        # matched lines only, in order, including the last line without line break
+        chunk = b'"GET /a HTTP/1.1" 1.000\nno match\n\n"GET /b HTTP/1.1" 2.000 "GET /c HTTP/1.1" 3.000\nno match'
+        groups = (log_analyzer._URL_RE.groupindex['url'], log_analyzer._URL_RE.groupindex['time'])
+        self.assertEqual([('/a', 1.0), ('/b', 3.0)],
+                         list(log_analyzer.find_records(chunk, log_analyzer._URL_RE, groups)))
+
+    def test_find_records_across_lines(self):
+        # with `\s` in the pattern, a truncated line doesn't take the time of the next record, nor drops it
+        pattern = re.compile(self.url_pattern.encode(), re.IGNORECASE | re.MULTILINE)
+        groups = (pattern.groupindex['url'], pattern.groupindex['time'])
+        chunk = (b'"GET /truncated HTTP/1.1"\n"GET /a HTTP/1.1" 200 0.500\n"GET /truncated HTTP/1.1"\n\n'
+                 b'"GET /b HTTP/1.1"\t\n 200 0.600\n"GET /c HTTP/1.1" 200 0.700')
+        self.assertEqual([('/a', 0.5), ('/c', 0.7)],  # as if searched line by line
+                         list(log_analyzer.find_records(chunk, pattern, groups)))
+
+    def test_parse_slices(self):
+        # each line belongs to exactly one of the slices, whatever the split offset is
+        expected = list(log_analyzer.get_url_time_from_record(self.log_file))
+        for offset in range(os.path.getsize(self.log_file) + 1):
+            self.assertEqual(expected, list(log_analyzer.get_url_time_from_record(self.log_file, end=offset)) +
+                             list(log_analyzer.get_url_time_from_record(self.log_file, start=offset)))
+
+
+class GetURLTimeFromGzRecordTest(unittest.TestCase):
+    log_file = os.path.join(TESTS_DIR, 'get_url_time_from_record', 'nginx-access-ui.log-20240301.gz')
+    plain_log_file = os.path.join(TESTS_DIR, 'get_url_time_from_record', 'nginx-access-ui.log-20240301')
+
+    def test_parse(self):
+        expected = list(log_analyzer.get_url_time_from_record(self.plain_log_file))
+        self.assertEqual(expected, list(log_analyzer.get_url_time_from_record(self.log_file)))
+        self.assertEqual(('/api/v2/banner/16852664', 0.199), expected[0])
+
+    @patch('log_analyzer._GZIP_DECOMPRESSORS', (('abrakadabra-unzip', '-dc'),))
+    def test_parse_no_decompressor(self):
+        # falls back to gzip module
+        expected = list(log_analyzer.get_url_time_from_record(self.plain_log_file))
+        self.assertEqual(expected, list(log_analyzer.get_url_time_from_record(self.log_file)))
+
+
+class GetMedianTest(unittest.TestCase):
+    def test_get_median(self):
+        self.assertEqual(2.0, log_analyzer.get_median([3.0, 1.0, 2.0]))
+        self.assertEqual(2.5, log_analyzer.get_median([4.0, 1.0, 3.0, 2.0]))
+        self.assertEqual(5.0, log_analyzer.get_median([5.0]))
+
+
+class _FirstRowCatcher(logging.Handler):
+    """Keeps only the first row statistics record, other records are dropped unformatted"""
+    captured = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.getMessage().startswith('First row statistics:'):  # msg is not necessarily a str
+            self.captured = self.format(record)
 
 
 class MainTest(unittest.TestCase):
+    report_file = os.path.join(TESTS_DIR, 'main', 'report-2023.02.28.html')  # joined once for all tests
+
     def tearDown(self) -> None:
-        if os.path.exists(os.path.join(TESTS_DIR, 'main', 'report-2023.02.28.html')):
-            os.remove(os.path.join(TESTS_DIR, 'main', 'report-2023.02.28.html'))
+        with suppress(FileNotFoundError):  # one syscall, no existence check beforehand
+            os.unlink(self.report_file)
 
     @patch('log_analyzer.sys.argv', ['log_analyzer.py', '--config',
                                      os.path.join(TESTS_DIR, 'main', 'good_config.ini')])
@@ -101,31 +249,57 @@ class MainTest(unittest.TestCase):
         # the /url-with-largest-times in a sample file should be the first in the report
         # and give 14.333 for time average, 22 as time max, 11 for time med, counted 3, time sum 43, etc...
         # We take this info from the log
-        with self.assertLogs(level='DEBUG') as captured:
+        catcher = _FirstRowCatcher()
+        root_logger = logging.getLogger()
+        root_level = root_logger.level
+        root_logger.addHandler(catcher)
+        root_logger.setLevel(logging.DEBUG)
+        try:
             log_analyzer.main()
-        self.assertTrue(os.path.exists(os.path.join(TESTS_DIR, 'main', 'report-2023.02.28.html')))
-        self.assertIn(
-            'DEBUG:root:First row statistics: /url-with-largest-times, count 3, count_perc 0.136, time_avg 14.333, '
+        finally:
+            root_logger.removeHandler(catcher)
+            root_logger.setLevel(root_level)
+        self.assertTrue(os.path.exists(self.report_file))
+        self.assertEqual(
+            'First row statistics: /url-with-largest-times, count 3, count_perc 0.136, time_avg 14.333, '
             'time_max 22.0, time_med 11.0, time_perc 0.867, time_sum 43.0',
-            captured.output)
+            catcher.captured)
+        with open(self.report_file) as f:
+            self.assertIn('var table = [{"url":"/url-with-largest-times","count":3,', f.read())  # table as JSON
 
     @patch('log_analyzer.sys.argv', ['log_analyzer.py', '--config',
-                                     os.path.join(TESTS_DIR, 'main', 'empty_log_dir_config.ini')])
-    def test_main_empty_log_dir(self):
-        with self.assertRaises(SystemExit):
+                                     os.path.join(TESTS_DIR, 'main', 'good_config.ini')])
+    @patch('log_analyzer._PARALLEL_MIN_SIZE', 0)
+    @patch('log_analyzer.os.cpu_count', lambda: 3)
+    @patch('log_analyzer._RECORD_PATTERN', re.compile(rb'"POST (?P<url>\S+) (?P<time>\d+\.\d{3})$', re.MULTILINE))
+    def test_main_parallel_record_pattern(self) -> None:
+        # record pattern reaches the worker processes: nothing matches, so too few records are parsed
+        with self.assertRaises(SystemExit), self.assertLogs(level='ERROR'):
             log_analyzer.main()
 
     @patch('log_analyzer.sys.argv', ['log_analyzer.py', '--config',
-                                     os.path.join(TESTS_DIR, 'main_unparseable_logs', 'unparseable_logs_config.ini')])
-    def test_main_unparseable_logs(self):
-        with self.assertRaises(SystemExit):
+                                     os.path.join(TESTS_DIR, 'main', 'good_config.ini')])
+    @patch('log_analyzer._PARALLEL_MIN_SIZE', 0)
+    @patch('log_analyzer.os.cpu_count', lambda: 3)
+    def test_main_parallel(self) -> None:
+        # same report, when the log is parsed by slices in worker processes
+        with self.assertLogs(level='DEBUG') as captured:
             log_analyzer.main()
+        self.assertIn('DEBUG:root:Parsing in 3 processes', captured.output)
+        self.assertIn(
+            'DEBUG:root:First row statistics: /url-with-largest-times, count 3, count_perc 0.136, time_avg 14.333, '
+            'time_max 22.0, time_med 11.0, time_perc 0.867, time_sum 43.0',
+            captured.output)
 
-    @patch('log_analyzer.sys.argv', ['log_analyzer.py', '--config',
-                                     os.path.join(TESTS_DIR, 'main_report_exists', 'report_exists_config.ini')])
-    def test_main_report_exists(self):
-        with self.assertRaises(SystemExit):
-            log_analyzer.main()
+    def test_main_exits(self):
+        # empty log dir, unparseable logs, report exists: nothing to do
+        for config_file in (os.path.join(TESTS_DIR, 'main', 'empty_log_dir_config.ini'),
+                            os.path.join(TESTS_DIR, 'main_unparseable_logs', 'unparseable_logs_config.ini'),
+                            os.path.join(TESTS_DIR, 'main_report_exists', 'report_exists_config.ini')):
+            with self.subTest(config=config_file), \
+                    patch('log_analyzer.sys.argv', ['log_analyzer.py', '--config', config_file]), \
+                    self.assertRaises(SystemExit):
+                log_analyzer.main()
 
 
 if __name__ == '__main__':